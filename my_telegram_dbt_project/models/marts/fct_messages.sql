@@ -4,7 +4,22 @@
 -- Links to dimension tables and includes key metrics
 {{ config(
     materialized='table',
-    unique_key='message_id',)
+    unique_key='message_id',
+    indexes=[
+      {'columns': ['message_tsv'], 'type': 'gin'},
+      {'columns': ['date_sk']}
+    ],
+    post_hook=[
+      -- Ordered indexes for the API's keyset pages (ORDER BY message_timestamp DESC, message_id DESC LIMIT N),
+      -- so a page reads N index entries instead of sorting the filtered set. Kept key-only: the pages select
+      -- message_text, which cannot be INCLUDEd (long posts exceed the 2704-byte btree tuple limit), so no
+      -- index-only scan is possible and extra INCLUDE columns would only add write cost.
+      -- Left unnamed: the previous table still holds its indexes while the hook runs.
+      "CREATE INDEX ON {{ this }} (channel_sk, message_timestamp DESC, message_id DESC)",
+      "CREATE INDEX ON {{ this }} (message_timestamp DESC, message_id DESC)",
+      -- Trigram index so ILIKE '%keyword%' substring search avoids a sequential scan (needs pg_trgm)
+      "CREATE INDEX ON {{ this }} USING GIN (message_text gin_trgm_ops)"
+    ])
 }}
 
 SELECT
@@ -16,6 +31,7 @@ SELECT
     stg.image_path,
     LENGTH(stg.message_text) AS message_length,
     CASE WHEN stg.image_path IS NOT NULL THEN TRUE ELSE FALSE END AS has_image,
+    TO_TSVECTOR('simple', COALESCE(stg.message_text, '')) AS message_tsv, -- Full-text search vector (GIN indexed)
 
     -- Foreign keys to dimension tables
     dim_c.channel_sk,
@@ -0,0 +1,30 @@
+-- models/marts/mart_channel_daily_counts.sql
+
+-- Daily message counts per channel, pre-aggregated for /reports/channel-activity/
+-- Counts for closed days never change, so incremental runs only recompute
+-- from the latest stored day onwards
+{{ config(
+    materialized='incremental',
+    unique_key=['channel_username', 'date_actual'],
+    indexes=[
+      {'columns': ['channel_username', 'date_actual'], 'unique': True}
+    ]
+) }}
+
+SELECT
+    dc.channel_username,
+    dd.date_actual,
+    COUNT(fm.message_id)::INT AS message_count
+FROM
+    {{ ref('fct_messages') }} fm
+JOIN
+    {{ ref('dim_channels') }} dc ON fm.channel_sk = dc.channel_sk
+JOIN
+    {{ ref('dim_dates') }} dd ON fm.date_sk = dd.date_sk
+{% if is_incremental() %}
+WHERE
+    dd.date_actual >= (SELECT MAX(date_actual) FROM {{ this }})
+{% endif %}
+GROUP BY
+    dc.channel_username,
+    dd.date_actual
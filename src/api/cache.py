@@ -0,0 +1,123 @@
+# src/api/cache.py
+
+import os
+import json
+import asyncio
+import logging
+import redis.asyncio as redis
+from cachetools import TTLCache
+from redis.exceptions import RedisError
+from fastapi import Request
+from dotenv import load_dotenv
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+REDIS_URL = os.getenv('REDIS_URL') # e.g. redis://redis:6379/0; caching is disabled when unset
+REPORT_CACHE_TTL = int(os.getenv('REPORT_CACHE_TTL', 600)) # Seconds; reports only change per ETL run
+
+# Key prefixes of the cached report endpoints, cleared after each dbt run
+REPORT_CACHE_PREFIXES = ('topobj:', 'activity:')
+
+# In-process caches (per uvicorn worker) for small, parameter-stable responses.
+# They cannot be cleared from outside the process, so keep the TTL short.
+LOCAL_CACHE_TTL = int(os.getenv('LOCAL_CACHE_TTL', 300))
+channels_cache = TTLCache(maxsize=256, ttl=LOCAL_CACHE_TTL)
+top_objects_cache = TTLCache(maxsize=256, ttl=LOCAL_CACHE_TTL)
+
+# One lock per in-flight (cache, key) miss
+_key_locks = {}
+
+def create_redis():
+    """
+    Creates the Redis client stored on app.state.redis.
+    Returns None when REDIS_URL is not configured.
+    """
+    if not REDIS_URL:
+        logger.info("REDIS_URL not set; report caching disabled.")
+        return None
+    logger.info("Redis report cache enabled.")
+    return redis.from_url(REDIS_URL)
+
+def get_redis(request: Request):
+    """
+    FastAPI dependency returning the shared Redis client (or None).
+    """
+    return getattr(request.app.state, 'redis', None)
+
+async def cache_get(client, key):
+    """
+    Returns the decoded cached value for key, or None on a miss.
+    Redis errors are logged and treated as a miss so the endpoint falls
+    back to the database.
+    """
+    if client is None:
+        return None
+    try:
+        value = await client.get(key)
+    except RedisError as e:
+        logger.warning(f"Redis GET failed for {key}: {e}")
+        return None
+    return json.loads(value) if value is not None else None
+
+async def cache_set(client, key, value, ttl=REPORT_CACHE_TTL):
+    """
+    Stores a JSON-serializable value under key with a TTL.
+    """
+    if client is None:
+        return
+    try:
+        await client.setex(key, ttl, json.dumps(value, default=str))
+    except RedisError as e:
+        logger.warning(f"Redis SETEX failed for {key}: {e}")
+
+async def get_or_compute(cache, key, compute):
+    """
+    Returns cache[key], awaiting compute() to fill it on a miss.
+    Concurrent misses on the same key wait for the first one instead of
+    all hitting the database at once.
+    """
+    try:
+        return cache[key]
+    except KeyError:
+        pass
+    lock_key = (id(cache), key)
+    lock = _key_locks.setdefault(lock_key, asyncio.Lock())
+    try:
+        async with lock:
+            try:
+                return cache[key]
+            except KeyError:
+                pass
+            value = await compute()
+            cache[key] = value
+            return value
+    finally:
+        if not lock.locked() and _key_locks.get(lock_key) is lock:
+            del _key_locks[lock_key]
+
+async def invalidate_reports(client):
+    """
+    Deletes every cached report entry. Run after `dbt run` so the API
+    serves the freshly built marts.
+    """
+    deleted = 0
+    for prefix in REPORT_CACHE_PREFIXES:
+        async for key in client.scan_iter(match=f"{prefix}*"):
+            deleted += await client.delete(key)
+    logger.info(f"Invalidated {deleted} cached report entries.")
+    return deleted
+
+async def _main():
+    client = create_redis()
+    if client is None:
+        return
+    try:
+        await invalidate_reports(client)
+    finally:
+        await client.aclose()
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    asyncio.run(_main())
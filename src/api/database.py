@@ -1,7 +1,9 @@
 # src/api/database.py
 
 import os
-import psycopg2
+import json
+import asyncpg
+from fastapi import Request
 from dotenv import load_dotenv
 import logging
 
@@ -14,49 +16,68 @@ DB_NAME = os.getenv('DB_NAME')
 DB_USER = os.getenv('DB_USER')
 DB_PASSWORD = os.getenv('DB_PASSWORD')
 DB_HOST = os.getenv('DB_HOST') # This will be 'db' in Docker Compose
-DB_PORT = os.getenv('DB_PORT', 5432)
+DB_PORT = int(os.getenv('DB_PORT', 5432))
 
-def get_db_connection():
+# Pool sizing is per uvicorn worker process: keep DB_POOL_MAX * workers
+# below the server's max_connections.
+DB_POOL_MIN = int(os.getenv('DB_POOL_MIN', 5))
+DB_POOL_MAX = int(os.getenv('DB_POOL_MAX', 20))
+
+# Every distinct SQL text is prepared once per connection and then only
+# bound/executed. The endpoints build a small, fixed set of query texts, so
+# the cache never churns; prepared statements are kept until invalidated.
+DB_STATEMENT_CACHE_SIZE = int(os.getenv('DB_STATEMENT_CACHE_SIZE', 256))
+DB_STATEMENT_CACHE_LIFETIME = int(os.getenv('DB_STATEMENT_CACHE_LIFETIME', 0)) # Seconds, 0 = no expiry
+
+async def _init_connection(conn):
+    """
+    Runs once for every new pooled connection.
+    Decodes json/jsonb columns into Python objects, as psycopg2 did.
+    """
+    for type_name in ('json', 'jsonb'):
+        await conn.set_type_codec(
+            type_name,
+            encoder=json.dumps,
+            decoder=json.loads,
+            schema='pg_catalog'
+        )
+
+async def create_pool():
     """
-    Establishes and returns a new PostgreSQL database connection.
-    It's recommended to use this function within a 'with' statement
-    or ensure connections are closed.
+    Creates and returns the asyncpg connection pool.
+    Called once from the FastAPI lifespan and stored on app.state.pool.
     """
     try:
-        conn = psycopg2.connect(
-            dbname=DB_NAME,
+        db_pool = await asyncpg.create_pool(
+            database=DB_NAME,
             user=DB_USER,
             password=DB_PASSWORD,
             host=DB_HOST,
-            port=DB_PORT
+            port=DB_PORT,
+            min_size=DB_POOL_MIN,
+            max_size=DB_POOL_MAX,
+            statement_cache_size=DB_STATEMENT_CACHE_SIZE,
+            max_cached_statement_lifetime=DB_STATEMENT_CACHE_LIFETIME,
+            init=_init_connection
         )
-        logger.info("Database connection established.")
-        return conn
-    except psycopg2.Error as e:
-        logger.error(f"Error connecting to database: {e}")
+        logger.info(f"Database connection pool created (min={DB_POOL_MIN}, max={DB_POOL_MAX}).")
+        return db_pool
+    except (asyncpg.PostgresError, OSError) as e:
+        logger.error(f"Error creating database connection pool: {e}")
         raise
 
-def get_db_cursor():
+async def get_db_conn(request: Request):
     """
-    Provides a database connection and cursor.
-    Use as a context manager:
-    with get_db_cursor() as (conn, cur):
-        # do database operations
+    FastAPI dependency yielding a pooled connection for the duration of a request:
+    async def endpoint(conn = Depends(get_db_conn)): ...
+    The connection is released back to the pool when the request finishes.
     """
-    conn = None
-    cur = None
-    try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        yield conn, cur
-    except Exception as e:
-        logger.error(f"Error getting database cursor: {e}")
-        if conn:
-            conn.rollback()
-        raise
-    finally:
-        if cur:
-            cur.close()
-        if conn:
-            conn.close()
-            logger.info("Database connection closed.")
\ No newline at end of file
+    async with request.app.state.pool.acquire() as conn:
+        yield conn
+
+def get_db_pool(request: Request):
+    """
+    FastAPI dependency returning the pool itself, for cached endpoints that
+    only acquire a connection on a cache miss.
+    """
+    return request.app.state.pool
@@ -1,45 +1,53 @@
 # src/api/main.py
 
 from fastapi import FastAPI, HTTPException, Query, Depends
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, ORJSONResponse
 from contextlib import asynccontextmanager
+import os
 import logging
-from typing import List, Optional
-from datetime import date, datetime
+from typing import List, Literal, Optional
+from datetime import date, datetime, timezone
 
-from .database import get_db_connection, get_db_cursor
-from .schemas import Message, Channel, ImageDetection, SearchQuery, MessageSearchResult, ChannelActivity, TopObjects
+import asyncpg
 
-# --- 1. Setup Logging ---
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler()
-    ]
+from .database import create_pool, get_db_conn, get_db_pool
+from .cache import create_redis, get_redis, cache_get, cache_set, get_or_compute, channels_cache, top_objects_cache
+from .schemas import (
+    Message, Channel, ImageDetection, SearchQuery, MessageSearchResult, ChannelActivity, TopObjects,
+    MessageCursor, MessagePage, ImageDetectionCursor, ImageDetectionPage
 )
+
+# --- 1. Setup Logging ---
+# Applied by uvicorn in every worker: passed by `python -m src.api.main`, or with
+# `uvicorn ... --log-config src/api/log_config.json`. Importing the app never reconfigures logging.
+LOG_CONFIG_PATH = os.path.join(os.path.dirname(__file__), 'log_config.json')
 logger = logging.getLogger(__name__)
 
-# --- 2. FastAPI App Lifespan (for DB connection testing) ---
+# --- 2. FastAPI App Lifespan (DB connection pool, report cache) ---
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """
     Context manager for application lifespan events.
-    Used to test database connection on startup.
+    Creates the asyncpg connection pool and tests it on startup,
+    closes the pool on shutdown. Also opens the optional Redis report cache.
     """
     logger.info("FastAPI app starting up...")
+    app.state.redis = create_redis()
     try:
+        app.state.pool = await create_pool()
         # Test database connection
-        with get_db_connection() as conn:
-            with conn.cursor() as cur:
-                cur.execute("SELECT 1;")
-            logger.info("Database connection test successful.")
+        async with app.state.pool.acquire() as conn:
+            await conn.fetchval("SELECT 1;")
+        logger.info("Database connection test successful.")
     except Exception as e:
         logger.critical(f"Database connection test failed on startup: {e}")
         # In a real production app, you might want to exit here or have a retry mechanism
         raise RuntimeError("Failed to connect to database on startup.") from e
 
     yield # Application runs
+    await app.state.pool.close()
+    if app.state.redis is not None:
+        await app.state.redis.aclose()
     logger.info("FastAPI app shutting down.")
 
 # --- 3. Initialize FastAPI App ---
@@ -47,7 +55,8 @@ app = FastAPI(
     title="Telegram Data Analytics API",
     description="API to query cleaned and enriched Telegram channel data.",
     version="1.0.0",
-    lifespan=lifespan # Attach the lifespan context manager
+    lifespan=lifespan, # Attach the lifespan context manager
+    default_response_class=ORJSONResponse # Encode JSON responses with orjson instead of stdlib json
 )
 
 # --- 4. API Endpoints ---
@@ -91,33 +100,67 @@ async def read_root():
     </html>
     """
 
-@app.get("/messages/", response_model=List[Message], summary="Retrieve a list of messages")
+def _to_naive_utc(ts: datetime) -> datetime:
+    """
+    Converts a timezone-aware cursor timestamp (e.g. ...Z) to naive UTC;
+    message_timestamp is a naive timestamp holding UTC.
+    """
+    if ts.tzinfo is None:
+        return ts
+    return ts.astimezone(timezone.utc).replace(tzinfo=None)
+
+@app.get("/messages/", response_model=MessagePage, summary="Retrieve a list of messages")
 async def get_messages(
     limit: int = Query(100, ge=1, le=1000),
-    offset: int = Query(0, ge=0),
+    after_ts: Optional[datetime] = Query(None, description="Keyset cursor: message_timestamp of the last message already seen"),
+    after_id: Optional[int] = Query(None, description="Keyset cursor: message_id of the last message already seen"),
     channel_username: Optional[str] = Query(None, description="Filter by channel username"),
     start_date: Optional[date] = Query(None, description="Filter messages from this date (YYYY-MM-DD)"),
-    end_date: Optional[date] = Query(None, description="Filter messages up to this date (YYYY-MM-DD)")
+    end_date: Optional[date] = Query(None, description="Filter messages up to this date (YYYY-MM-DD)"),
+    conn: asyncpg.Connection = Depends(get_db_conn)
 ):
     """
-    Retrieves a list of messages from the fct_messages table.
-    Allows filtering by channel, date range, and pagination.
+    Retrieves a page of messages from the fct_messages table, newest first.
+    Allows filtering by channel and date range. Pagination is keyset-based:
+    pass the returned next_cursor as after_ts/after_id to get the next page.
     """
+    if (after_ts is None) != (after_id is None):
+        raise HTTPException(status_code=400, detail="after_ts and after_id must be provided together")
+
     query_parts = []
     params = []
 
     if channel_username:
-        query_parts.append("dc.channel_username ILIKE %s")
-        params.append(f"%{channel_username}%")
+        # Resolve the username to channel_sk first so the page can use the (channel_sk, message_timestamp) index
+        try:
+            rows = await conn.fetch(
+                "SELECT channel_sk FROM public.dim_channels WHERE channel_username ILIKE $1;", f"%{channel_username}%"
+            )
+        except Exception as e:
+            logger.error(f"Error resolving channel {channel_username}: {e}")
+            raise HTTPException(status_code=500, detail="Internal server error")
+        channel_sks = [r['channel_sk'] for r in rows]
+        if not channel_sks:
+            return MessagePage.model_construct(messages=[], next_cursor=None)
+        if len(channel_sks) == 1:
+            params.append(channel_sks[0])
+            query_parts.append(f"fm.channel_sk = ${len(params)}")
+        else:
+            params.append(channel_sks)
+            query_parts.append(f"fm.channel_sk = ANY(${len(params)})")
     if start_date:
-        query_parts.append("fm.message_timestamp >= %s")
         params.append(start_date)
+        query_parts.append(f"fm.message_timestamp >= ${len(params)}::date")
     if end_date:
-        query_parts.append("fm.message_timestamp <= %s")
         params.append(end_date)
+        query_parts.append(f"fm.message_timestamp <= ${len(params)}::date")
+    if after_ts is not None:
+        params.extend([_to_naive_utc(after_ts), after_id])
+        query_parts.append(f"(fm.message_timestamp, fm.message_id) < (${len(params) - 1}, ${len(params)})")
 
     where_clause = "WHERE " + " AND ".join(query_parts) if query_parts else ""
 
+    params.append(limit)
     sql_query = f"""
         SELECT
             fm.message_id,
@@ -132,35 +175,36 @@ async def get_messages(
             fm.date_sk
         FROM
             public.fct_messages fm
-        LEFT JOIN
-            public.dim_channels dc ON fm.channel_sk = dc.channel_sk
         {where_clause}
         ORDER BY
-            fm.message_timestamp DESC
-        LIMIT %s OFFSET %s;
+            fm.message_timestamp DESC, fm.message_id DESC
+        LIMIT ${len(params)};
     """
-    params.extend([limit, offset])
 
     try:
-        with get_db_cursor() as (conn, cur):
-            cur.execute(sql_query, params)
-            messages_data = cur.fetchall()
-            # Get column names from cursor description
-            column_names = [desc[0] for desc in cur.description]
-            # Map rows to dictionaries for Pydantic parsing
-            messages_dicts = [dict(zip(column_names, row)) for row in messages_data]
-            return [Message(**msg) for msg in messages_dicts]
+        # Pages are capped by LIMIT, so one fetch round-trip beats a cursor's BEGIN/DECLARE/FETCH/COMMIT
+        rows = await conn.fetch(sql_query, *params)
+        messages = [Message.model_construct(**r) for r in rows]
     except Exception as e:
         logger.error(f"Error retrieving messages: {e}")
         raise HTTPException(status_code=500, detail="Internal server error")
 
+    next_cursor = None
+    if len(messages) == limit:
+        last = messages[-1]
+        next_cursor = MessageCursor.model_construct(after_ts=last.message_timestamp, after_id=last.message_id)
+    return MessagePage.model_construct(messages=messages, next_cursor=next_cursor)
+
 @app.get("/channels/", response_model=List[Channel], summary="Retrieve a list of channels")
 async def get_channels(
     limit: int = Query(100, ge=1, le=1000),
-    offset: int = Query(0, ge=0)
+    offset: int = Query(0, ge=0),
+    db_pool: asyncpg.Pool = Depends(get_db_pool)
 ):
     """
     Retrieves a list of channels from the dim_channels table.
+    Pages are cached in-process for LOCAL_CACHE_TTL seconds; a pooled
+    connection is only acquired on a cache miss.
     """
     sql_query = """
         SELECT
@@ -173,42 +217,53 @@ async def get_channels(
             public.dim_channels
         ORDER BY
             channel_username ASC
-        LIMIT %s OFFSET %s;
+        LIMIT $1 OFFSET $2;
     """
-    try:
-        with get_db_cursor() as (conn, cur):
-            cur.execute(sql_query, (limit, offset))
-            channels_data = cur.fetchall()
-            column_names = [desc[0] for desc in cur.description]
-            channels_dicts = [dict(zip(column_names, row)) for row in channels_data]
-            return [Channel(**ch) for ch in channels_dicts]
-    except Exception as e:
-        logger.error(f"Error retrieving channels: {e}")
-        raise HTTPException(status_code=500, detail="Internal server error")
 
-@app.get("/detections/", response_model=List[ImageDetection], summary="Retrieve a list of image detections")
+    async def fetch_channels():
+        try:
+            async with db_pool.acquire() as conn:
+                rows = await conn.fetch(sql_query, limit, offset)
+            return [Channel.model_construct(**r) for r in rows]
+        except Exception as e:
+            logger.error(f"Error retrieving channels: {e}")
+            raise HTTPException(status_code=500, detail="Internal server error")
+
+    return await get_or_compute(channels_cache, (limit, offset), fetch_channels)
+
+@app.get("/detections/", response_model=ImageDetectionPage, summary="Retrieve a list of image detections")
 async def get_detections(
     limit: int = Query(100, ge=1, le=1000),
-    offset: int = Query(0, ge=0),
+    after_ts: Optional[datetime] = Query(None, description="Keyset cursor: detection_timestamp of the last detection already seen"),
+    after_id: Optional[str] = Query(None, description="Keyset cursor: detection_id of the last detection already seen"),
     object_class: Optional[str] = Query(None, description="Filter by detected object class"),
-    message_id: Optional[int] = Query(None, description="Filter by original Telegram message ID")
+    message_id: Optional[int] = Query(None, description="Filter by original Telegram message ID"),
+    conn: asyncpg.Connection = Depends(get_db_conn)
 ):
     """
-    Retrieves a list of image detections from the fct_image_detections table.
-    Allows filtering by object class, message ID, and pagination.
+    Retrieves a page of image detections from the fct_image_detections table, newest first.
+    Allows filtering by object class and message ID. Pagination is keyset-based:
+    pass the returned next_cursor as after_ts/after_id to get the next page.
     """
+    if (after_ts is None) != (after_id is None):
+        raise HTTPException(status_code=400, detail="after_ts and after_id must be provided together")
+
     query_parts = []
     params = []
 
     if object_class:
-        query_parts.append("detected_object_class ILIKE %s")
         params.append(f"%{object_class}%")
+        query_parts.append(f"detected_object_class ILIKE ${len(params)}")
     if message_id:
-        query_parts.append("message_id = %s")
         params.append(message_id)
+        query_parts.append(f"message_id = ${len(params)}")
+    if after_ts is not None:
+        params.extend([_to_naive_utc(after_ts), after_id])
+        query_parts.append(f"(detection_timestamp, detection_id) < (${len(params) - 1}, ${len(params)})")
 
     where_clause = "WHERE " + " AND ".join(query_parts) if query_parts else ""
 
+    params.append(limit)
     sql_query = f"""
         SELECT
             detection_id,
@@ -222,71 +277,85 @@ async def get_detections(
             public.fct_image_detections
         {where_clause}
         ORDER BY
-            detection_timestamp DESC
-        LIMIT %s OFFSET %s;
+            detection_timestamp DESC, detection_id DESC
+        LIMIT ${len(params)};
     """
-    params.extend([limit, offset])
 
     try:
-        with get_db_cursor() as (conn, cur):
-            cur.execute(sql_query, params)
-            detections_data = cur.fetchall()
-            column_names = [desc[0] for desc in cur.description]
-            detections_dicts = [dict(zip(column_names, row)) for row in detections_data]
-            return [ImageDetection(**det) for det in detections_dicts]
+        rows = await conn.fetch(sql_query, *params)
+        detections = [ImageDetection.model_construct(**r) for r in rows]
     except Exception as e:
         logger.error(f"Error retrieving detections: {e}")
         raise HTTPException(status_code=500, detail="Internal server error")
 
+    next_cursor = None
+    if len(detections) == limit:
+        last = detections[-1]
+        next_cursor = ImageDetectionCursor.model_construct(after_ts=last.detection_timestamp, after_id=last.detection_id)
+    return ImageDetectionPage.model_construct(detections=detections, next_cursor=next_cursor)
+
+# WHERE predicate for each search mode; the keyword is always bound to $1
+SEARCH_PREDICATES = {
+    'fulltext': "message_tsv @@ plainto_tsquery('simple', $1)", # GIN index on message_tsv
+    'substring': "message_text ILIKE $1", # GIN trigram index on message_text
+}
+
 @app.get("/search/messages/", response_model=MessageSearchResult, summary="Search messages by keyword")
 async def search_messages(
     search_query: str = Query(..., min_length=3, description="Keyword to search in message text"),
+    match: Literal['fulltext', 'substring'] = Query('fulltext', description="'fulltext' matches whole words, 'substring' matches any part of the text"),
     limit: int = Query(100, ge=1, le=1000),
-    offset: int = Query(0, ge=0)
+    offset: int = Query(0, ge=0),
+    conn: asyncpg.Connection = Depends(get_db_conn)
 ):
     """
-    Searches for messages containing a specific keyword in their text.
+    Searches for messages whose text matches the given keywords.
+    'fulltext' uses the GIN-indexed message_tsv column; 'substring' keeps exact
+    ILIKE semantics, served by the pg_trgm index (keywords are >= 3 characters).
+    The total match count comes back with the page itself via COUNT(*) OVER().
     """
-    # Count total results first
-    count_query = """
+    predicate = SEARCH_PREDICATES[match]
+    search_param = search_query if match == 'fulltext' else f"%{search_query}%"
+
+    sql_query = f"""
+        SELECT
+            message_id,
+            message_text,
+            message_timestamp,
+            views_count,
+            forwards_count,
+            image_path,
+            message_length,
+            has_image,
+            channel_sk,
+            date_sk,
+            COUNT(*) OVER() AS total_results
+        FROM
+            public.fct_messages
+        WHERE
+            {predicate}
+        ORDER BY
+            message_timestamp DESC
+        LIMIT $2 OFFSET $3;
+    """
+    # Only needed when the page is past the last match and carries no window count
+    count_query = f"""
         SELECT COUNT(*)
         FROM public.fct_messages
-        WHERE message_text ILIKE %s;
+        WHERE {predicate};
     """
-    search_pattern = f"%{search_query}%"
 
     try:
-        with get_db_cursor() as (conn, cur):
-            cur.execute(count_query, (search_pattern,))
-            total_results = cur.fetchone()[0]
-
-            sql_query = f"""
-                SELECT
-                    message_id,
-                    message_text,
-                    message_timestamp,
-                    views_count,
-                    forwards_count,
-                    image_path,
-                    message_length,
-                    has_image,
-                    channel_sk,
-                    date_sk
-                FROM
-                    public.fct_messages
-                WHERE
-                    message_text ILIKE %s
-                ORDER BY
-                    message_timestamp DESC
-                LIMIT %s OFFSET %s;
-            """
-            cur.execute(sql_query, (search_pattern, limit, offset))
-            messages_data = cur.fetchall()
-            column_names = [desc[0] for desc in cur.description]
-            messages_dicts = [dict(zip(column_names, row)) for row in messages_data]
-            messages = [Message(**msg) for msg in messages_dicts]
-
-            return MessageSearchResult(total_results=total_results, messages=messages)
+        rows = await conn.fetch(sql_query, search_param, limit, offset)
+        messages = [Message.model_construct(**r) for r in rows]
+        if rows:
+            total_results = rows[0]['total_results']
+        elif offset:
+            total_results = await conn.fetchval(count_query, search_param)
+        else:
+            total_results = 0
+
+        return MessageSearchResult.model_construct(total_results=total_results, messages=messages)
     except Exception as e:
         logger.error(f"Error searching messages: {e}")
         raise HTTPException(status_code=500, detail="Internal server error")
@@ -295,62 +364,73 @@ async def search_messages(
 async def get_channel_activity(
     channel_username: str,
     start_date: Optional[date] = Query(None, description="Start date (YYYY-MM-DD)"),
-    end_date: Optional[date] = Query(None, description="End date (YYYY-MM-DD)")
+    end_date: Optional[date] = Query(None, description="End date (YYYY-MM-DD)"),
+    db_pool: asyncpg.Pool = Depends(get_db_pool),
+    redis_client = Depends(get_redis)
 ):
     """
     Retrieves the daily message count for a specific channel within a date range.
+    Responses are cached in Redis until the TTL expires or the next dbt run;
+    a pooled connection is only acquired on a cache miss.
     """
+    cache_key = f"activity:{channel_username}:{start_date}:{end_date}"
+    cached = await cache_get(redis_client, cache_key)
+    if cached is not None:
+        return cached
+
     query_parts = []
     params = []
 
-    query_parts.append("dc.channel_username = %s")
     params.append(channel_username)
+    query_parts.append(f"channel_username = ${len(params)}")
 
     if start_date:
-        query_parts.append("dd.date_actual >= %s")
         params.append(start_date)
+        query_parts.append(f"date_actual >= ${len(params)}")
     if end_date:
-        query_parts.append("dd.date_actual <= %s")
         params.append(end_date)
+        query_parts.append(f"date_actual <= ${len(params)}")
 
     where_clause = "WHERE " + " AND ".join(query_parts) if query_parts else ""
 
+    # Served from the dbt rollup instead of aggregating fct_messages per request
     sql_query = f"""
         SELECT
-            dc.channel_username,
-            dd.date_actual AS date,
-            COUNT(fm.message_id)::int AS message_count
+            channel_username,
+            date_actual::timestamp AS date, -- Matches ChannelActivity.date (datetime)
+            message_count
         FROM
-            public.fct_messages fm
-        JOIN
-            public.dim_channels dc ON fm.channel_sk = dc.channel_sk
-        JOIN
-            public.dim_dates dd ON fm.date_sk = dd.date_sk
+            public.mart_channel_daily_counts
         {where_clause}
-        GROUP BY
-            dc.channel_username, dd.date_actual
         ORDER BY
-            dd.date_actual ASC;
+            date_actual ASC;
     """
     try:
-        with get_db_cursor() as (conn, cur):
-            cur.execute(sql_query, params)
-            activity_data = cur.fetchall()
-            column_names = [desc[0] for desc in cur.description]
-            activity_dicts = [dict(zip(column_names, row)) for row in activity_data]
-            return [ChannelActivity(**act) for act in activity_dicts]
+        async with db_pool.acquire() as conn:
+            rows = await conn.fetch(sql_query, *params)
+        activity = [ChannelActivity.model_construct(**r) for r in rows]
     except Exception as e:
         logger.error(f"Error retrieving channel activity for {channel_username}: {e}")
         raise HTTPException(status_code=500, detail="Internal server error")
 
+    await cache_set(redis_client, cache_key, [act.model_dump(mode='json') for act in activity])
+    return activity
+
 @app.get("/reports/top-objects/", response_model=List[TopObjects], summary="Get top detected objects from images")
 async def get_top_objects(
     limit: int = Query(10, ge=1, le=100),
-    min_confidence: float = Query(0.5, ge=0.0, le=1.0, description="Minimum confidence score for detections")
+    min_confidence: float = Query(0.5, ge=0.0, le=1.0, description="Minimum confidence score for detections"),
+    db_pool: asyncpg.Pool = Depends(get_db_pool),
+    redis_client = Depends(get_redis)
 ):
     """
     Retrieves the most frequently detected objects across all images.
+    Responses are cached in-process for LOCAL_CACHE_TTL seconds, backed by
+    Redis until the TTL expires or the next dbt run. A pooled connection is
+    only acquired when both caches miss.
     """
+    cache_key = f"topobj:{min_confidence}:{limit}"
+
     sql_query = """
         SELECT
             detected_object_class,
@@ -358,20 +438,40 @@ async def get_top_objects(
         FROM
             public.fct_image_detections
         WHERE
-            confidence >= %s
+            confidence >= $1
         GROUP BY
             detected_object_class
         ORDER BY
             count DESC
-        LIMIT %s;
+        LIMIT $2;
     """
-    try:
-        with get_db_cursor() as (conn, cur):
-            cur.execute(sql_query, (min_confidence, limit))
-            top_objects_data = cur.fetchall()
-            column_names = [desc[0] for desc in cur.description]
-            top_objects_dicts = [dict(zip(column_names, row)) for row in top_objects_data]
-            return [TopObjects(**obj) for obj in top_objects_dicts]
-    except Exception as e:
-        logger.error(f"Error retrieving top objects: {e}")
-        raise HTTPException(status_code=500, detail="Internal server error")
\ No newline at end of file
+
+    async def fetch_top_objects():
+        cached = await cache_get(redis_client, cache_key)
+        if cached is not None:
+            return cached
+
+        try:
+            async with db_pool.acquire() as conn:
+                rows = await conn.fetch(sql_query, min_confidence, limit)
+            top_objects = [TopObjects.model_construct(**r) for r in rows]
+        except Exception as e:
+            logger.error(f"Error retrieving top objects: {e}")
+            raise HTTPException(status_code=500, detail="Internal server error")
+
+        await cache_set(redis_client, cache_key, [obj.model_dump(mode='json') for obj in top_objects])
+        return top_objects
+
+    return await get_or_compute(top_objects_cache, cache_key, fetch_top_objects)
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run(
+        "src.api.main:app",
+        host=os.getenv('API_HOST', '0.0.0.0'),
+        port=int(os.getenv('API_PORT', 8000)),
+        workers=int(os.getenv('API_WORKERS', 1)), # DB_POOL_MAX applies per worker
+        loop='uvloop',
+        http='httptools',
+        log_config=LOG_CONFIG_PATH # uvicorn loads .json config files itself
+    )
@@ -1,6 +1,6 @@
 # src/api/schemas.py
 
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
 from datetime import datetime
 from typing import Optional, List, Dict, Any
 
@@ -14,8 +14,7 @@ class Channel(BaseModel):
     last_message_date: Optional[datetime]
     total_messages_scraped: Optional[int]
 
-    class Config:
-        from_attributes = True # Allow mapping from SQLAlchemy/ORM objects
+    model_config = ConfigDict(from_attributes=True) # Allow mapping from ORM/record objects
 
 class Date(BaseModel):
     """Pydantic model for dim_dates."""
@@ -29,8 +28,7 @@ class Date(BaseModel):
     day_of_week_name: str
     is_weekend: bool
 
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 class Message(BaseModel):
     """Pydantic model for fct_messages."""
@@ -45,8 +43,7 @@ class Message(BaseModel):
     channel_sk: str
     date_sk: int
 
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 class ImageDetection(BaseModel):
     """Pydantic model for fct_image_detections."""
@@ -58,11 +55,30 @@ class ImageDetection(BaseModel):
     bounding_box: Optional[Dict[str, Any]] # JSONB field, Pydantic handles dict
     detection_timestamp: datetime
 
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 # --- API Request/Response Schemas (Examples) ---
 
+class MessageCursor(BaseModel):
+    """Keyset cursor for /messages/; pass back as ?after_ts=...&after_id=..."""
+    after_ts: datetime
+    after_id: int
+
+class MessagePage(BaseModel):
+    """Schema for keyset-paginated message responses."""
+    messages: List[Message]
+    next_cursor: Optional[MessageCursor] # None on the last page
+
+class ImageDetectionCursor(BaseModel):
+    """Keyset cursor for /detections/; pass back as ?after_ts=...&after_id=..."""
+    after_ts: datetime
+    after_id: str
+
+class ImageDetectionPage(BaseModel):
+    """Schema for keyset-paginated image detection responses."""
+    detections: List[ImageDetection]
+    next_cursor: Optional[ImageDetectionCursor] # None on the last page
+
 class SearchQuery(BaseModel):
     """Schema for message search requests."""
     query: str
@@ -83,4 +99,4 @@ class ChannelActivity(BaseModel):
 class TopObjects(BaseModel):
     """Schema for top detected objects."""
     detected_object_class: str
-    count: int
\ No newline at end of file
+    count: int
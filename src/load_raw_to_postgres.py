@@ -1,22 +1,45 @@
 import os
-import json
+import multiprocessing
+from collections import defaultdict
+from itertools import islice
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+import ijson
+import orjson
+import pyarrow.parquet as pq
 import psycopg2
+from psycopg2.extras import execute_values
 from dotenv import load_dotenv
 import logging
+from logging.handlers import QueueHandler, QueueListener
 from datetime import datetime
 from tqdm import tqdm
 
 # --- 1. Setup Logging ---
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(),
-        logging.FileHandler('data_loader.log')
-    ]
-)
+# Handlers are only configured when run as a script (see setup_logging)
+LOG_FORMATTER = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+def attach_queue_handler(log_queue):
+    """Routes all log records of this process into log_queue (also used as worker initializer)."""
+    root = logging.getLogger()
+    root.setLevel(logging.INFO)
+    root.handlers[:] = [QueueHandler(log_queue)]
+
+def setup_logging():
+    """
+    Sends log records through a queue to a QueueListener thread that owns the
+    console and file handlers, so neither the load loop nor the parse workers
+    wait on disk writes. Returns the started listener and its queue.
+    """
+    log_queue = multiprocessing.Queue(-1)
+    handlers = [logging.StreamHandler(), logging.FileHandler('data_loader.log')]
+    for handler in handlers:
+        handler.setFormatter(LOG_FORMATTER)
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    attach_queue_handler(log_queue)
+    listener.start()
+    return listener, log_queue
+
 # --- 2. Load Environment Variables ---
 load_dotenv()
 
@@ -29,6 +52,11 @@ DB_PORT = os.getenv('DB_PORT', 5432) # Default to 5432
 RAW_DATA_LAKE_PATH = 'data/raw/telegram_messages'
 RAW_TABLE_NAME = 'raw_telegram_messages'
 RAW_SCHEMA_NAME = 'raw' # As per challenge document
+INSERT_PAGE_SIZE = 1000 # Rows per multi-row INSERT statement
+COMMIT_EVERY_FILES = 50 # Commit after this many files...
+COMMIT_EVERY_ROWS = 10000 # ...or this many inserted rows, whichever comes first
+LOADER_WORKERS = int(os.getenv('LOADER_WORKERS', os.cpu_count() or 1)) # Processes parsing JSON files
+LOADER_MAX_IN_FLIGHT = 2 * LOADER_WORKERS # Files parsed ahead of the inserts; bounds the rows held in memory
 
 # --- 3. Database Connection Function ---
 def get_db_connection():
@@ -63,73 +91,184 @@ def create_raw_table(cursor):
     """)
     logger.info(f"Ensured table {RAW_SCHEMA_NAME}.{RAW_TABLE_NAME} exists.")
 
-# --- 5. Load Data Function ---
-def load_json_to_postgres():
-    """Reads JSON files from data lake and loads them into PostgreSQL."""
+# --- 5. Find Raw Files Function ---
+RAW_FILE_EXTENSIONS = ('.json', '.parquet') # Formats written by the scraper
+
+def find_raw_files():
+    """
+    Returns the paths of all channel JSON/Parquet files in the partitioned data lake.
+    os.scandir entries carry the file type from the directory read itself,
+    so no extra stat() is needed per entry.
+    """
+    raw_files = []
+    with os.scandir(RAW_DATA_LAKE_PATH) as date_entries:
+        for date_entry in date_entries:
+            if not date_entry.is_dir(follow_symlinks=False) or date_entry.name == 'images': # Skip 'images' folder
+                continue
+
+            with os.scandir(date_entry.path) as channel_entries:
+                for channel_entry in channel_entries:
+                    if not channel_entry.is_dir(follow_symlinks=False):
+                        continue
+
+                    with os.scandir(channel_entry.path) as file_entries:
+                        raw_files.extend(
+                            file_entry.path for file_entry in file_entries
+                            if file_entry.name.endswith(RAW_FILE_EXTENSIONS)
+                        )
+    return raw_files
+
+# --- 6. Parse File Function (runs in worker processes) ---
+def parse_parquet_file(file_path):
+    """
+    Reads one channel Parquet file into (message_id, channel_username, message_json) rows.
+    The scraper already stores each message as JSON in message_data, so only
+    the three needed columns are read and nothing is re-encoded.
+    """
+    parquet_file = os.path.basename(file_path)
+    table = pq.read_table(file_path, columns=['id', 'channel_username', 'message_data'])
+    if not table.num_rows:
+        logger.warning(f"File {parquet_file} is empty or contains no messages.")
+    columns = table.to_pydict()
+    insert_values = []
+    for msg_id, channel_user, message_json in zip(columns['id'], columns['channel_username'], columns['message_data']):
+        # Same check and warning as the JSON path in parse_file
+        if msg_id is None or channel_user is None:
+            logger.warning(f"Skipping message due to missing ID or channel_username in file {parquet_file}: {message_json}")
+            continue
+        insert_values.append((msg_id, channel_user, message_json))
+    return insert_values
+
+def parse_file(file_path):
+    """
+    Parses one channel JSON file into (message_id, channel_username, message_json) rows.
+    Runs in a worker process: parsing and re-encoding is pure CPU work.
+    Messages are streamed one at a time with ijson, so the parsed objects of
+    the whole file are never held at once; the returned list holds the file's
+    compact encoded rows.
+    Parquet files are handed to parse_parquet_file.
+    """
+    if file_path.endswith('.parquet'):
+        return parse_parquet_file(file_path)
+
+    json_file = os.path.basename(file_path)
+    insert_values = []
+    message_count = 0
+    with open(file_path, 'rb') as f:
+        # use_float keeps numbers as float (not Decimal) so orjson can encode them
+        for msg in ijson.items(f, 'item', use_float=True):
+            message_count += 1
+            # Ensure message_id and channel_username are present
+            msg_id = msg.get('id')
+            channel_user = msg.get('channel_username')
+            if msg_id is None or channel_user is None:
+                logger.warning(f"Skipping message due to missing ID or channel_username in file {json_file}: {msg}")
+                continue
+            # Encode here rather than passing psycopg2.extras.Json(msg): Json serializes with
+            # Python json.dumps at adapt time in the main process, while this runs in parallel
+            # workers, and a str is cheaper to send back across processes than the dict.
+            insert_values.append((msg_id, channel_user, orjson.dumps(msg).decode()))
+
+    if not message_count:
+        logger.warning(f"File {json_file} is empty or contains no messages.")
+    return insert_values
+
+def iter_parsed_files(executor, file_paths, max_in_flight=LOADER_MAX_IN_FLIGHT):
+    """
+    Submits parse_file for file_paths and yields (file_path, future) as parses finish.
+    At most max_in_flight files are submitted but not yet consumed, so peak
+    memory is a few files' rows rather than the whole data lake.
+    """
+    file_paths = iter(file_paths)
+    in_flight = {executor.submit(parse_file, path): path for path in islice(file_paths, max_in_flight)}
+    while in_flight:
+        done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+        for future in done:
+            file_path = in_flight.pop(future)
+            next_path = next(file_paths, None)
+            if next_path is not None:
+                in_flight[executor.submit(parse_file, next_path)] = next_path
+            yield file_path, future
+
+# --- 7. Load Data Function ---
+def load_json_to_postgres(log_queue=None):
+    """
+    Reads JSON/Parquet files from data lake and loads them into PostgreSQL.
+    Files are parsed in a process pool; the main process only inserts.
+    If given, log_queue is attached to the workers' logging (see setup_logging).
+    """
     conn = None
     try:
         conn = get_db_connection()
         cur = conn.cursor()
+        # The load is idempotent and can be re-run from the data lake, so don't wait for WAL flushes
+        cur.execute("SET synchronous_commit = off;")
 
         create_raw_table(cur) # Ensure table exists before loading
+        conn.commit()
 
         total_files_processed = 0
         total_messages_inserted = 0
+        files_since_commit = 0
+        rows_since_commit = 0
+        channel_stats = defaultdict(lambda: [0, 0]) # channel -> [files, new inserts]
 
-        # Iterate through the partitioned data lake structure
-        for date_dir in tqdm(os.listdir(RAW_DATA_LAKE_PATH), desc="Processing Dates"):
-            date_path = os.path.join(RAW_DATA_LAKE_PATH, date_dir)
-            if not os.path.isdir(date_path) or date_dir == 'images': # Skip 'images' folder
-                continue
+        # Use ON CONFLICT DO NOTHING to handle duplicates (from UNIQUE constraint)
+        # This makes the load idempotent - running it multiple times won't duplicate data
+        # execute_values sends one multi-row INSERT per page instead of one INSERT per row
+        insert_query = f"""
+            INSERT INTO {RAW_SCHEMA_NAME}.{RAW_TABLE_NAME} (message_id, channel_username, message_data)
+            VALUES %s
+            ON CONFLICT (message_id, channel_username) DO NOTHING
+            RETURNING id;
+        """
 
-            for channel_dir in os.listdir(date_path):
-                channel_path = os.path.join(date_path, channel_dir)
-                if not os.path.isdir(channel_path):
+        raw_files = find_raw_files()
+
+        worker_logging = {'initializer': attach_queue_handler, 'initargs': (log_queue,)} if log_queue else {}
+        with ProcessPoolExecutor(max_workers=LOADER_WORKERS, **worker_logging) as executor:
+            for file_path, future in tqdm(iter_parsed_files(executor, raw_files), total=len(raw_files), desc="Loading Files"):
+                json_file = os.path.basename(file_path)
+                channel = os.path.basename(os.path.dirname(file_path))
+                total_files_processed += 1
+                channel_stats[channel][0] += 1
+                logger.debug(f"Loading data from: {file_path}")
+
+                try:
+                    insert_values = future.result()
+                except ijson.JSONError as e:
+                    logger.error(f"Error decoding JSON from {json_file}: {e}")
+                    continue
+                except Exception as e:
+                    logger.error(f"Error processing {json_file}: {e}")
                     continue
 
-                for json_file in os.listdir(channel_path):
-                    if json_file.endswith('.json'):
-                        file_path = os.path.join(channel_path, json_file)
-                        total_files_processed += 1
-                        logger.info(f"Loading data from: {file_path}")
-
-                        try:
-                            with open(file_path, 'r', encoding='utf-8') as f:
-                                messages = json.load(f)
-
-                            if not messages:
-                                logger.warning(f"File {json_file} is empty or contains no messages.")
-                                continue
-
-                            # Prepare data for insertion
-                            insert_values = []
-                            for msg in messages:
-                                # Ensure message_id and channel_username are present
-                                msg_id = msg.get('id')
-                                channel_user = msg.get('channel_username')
-                                if msg_id is None or channel_user is None:
-                                    logger.warning(f"Skipping message due to missing ID or channel_username in file {json_file}: {msg}")
-                                    continue
-                                insert_values.append((msg_id, channel_user, json.dumps(msg))) # json.dumps to store dict as JSON string
-
-                            if insert_values:
-                                # Use ON CONFLICT DO NOTHING to handle duplicates (from UNIQUE constraint)
-                                # This makes the load idempotent - running it multiple times won't duplicate data
-                                insert_query = f"""
-                                    INSERT INTO {RAW_SCHEMA_NAME}.{RAW_TABLE_NAME} (message_id, channel_username, message_data)
-                                    VALUES (%s, %s, %s)
-                                    ON CONFLICT (message_id, channel_username) DO NOTHING;
-                                """
-                                cur.executemany(insert_query, insert_values)
-                                inserted_rows = cur.rowcount # Number of rows actually inserted (not skipped by ON CONFLICT)
-                                total_messages_inserted += inserted_rows
-                                logger.info(f"Inserted/skipped {len(insert_values)} messages from {json_file}. Actual new inserts: {inserted_rows}")
-                            conn.commit() # Commit after each file or batch
-
-                        except json.JSONDecodeError as e:
-                            logger.error(f"Error decoding JSON from {json_file}: {e}")
-                        except Exception as e:
-                            logger.error(f"Error processing {json_file}: {e}")
+                if insert_values:
+                    # A savepoint per file keeps one bad file from discarding the rest of the uncommitted batch
+                    cur.execute("SAVEPOINT load_file;")
+                    try:
+                        inserted = execute_values(cur, insert_query, insert_values, page_size=INSERT_PAGE_SIZE, fetch=True)
+                        cur.execute("RELEASE SAVEPOINT load_file;")
+                    except psycopg2.Error as e:
+                        logger.error(f"Error inserting messages from {json_file}: {e}")
+                        cur.execute("ROLLBACK TO SAVEPOINT load_file;")
+                        continue
+                    inserted_rows = len(inserted) # Rows actually inserted (ON CONFLICT skips return nothing)
+                    total_messages_inserted += inserted_rows
+                    rows_since_commit += inserted_rows
+                    channel_stats[channel][1] += inserted_rows
+                    logger.debug(f"Inserted/skipped {len(insert_values)} messages from {json_file}. Actual new inserts: {inserted_rows}")
+
+                files_since_commit += 1
+                if files_since_commit >= COMMIT_EVERY_FILES or rows_since_commit >= COMMIT_EVERY_ROWS:
+                    conn.commit()
+                    files_since_commit = 0
+                    rows_since_commit = 0
+
+        conn.commit() # Commit the final partial batch
+
+        for channel, (files, inserted_rows) in sorted(channel_stats.items()):
+            logger.info(f"Channel {channel}: {files} files processed, {inserted_rows} new messages inserted.")
 
         logger.info(f"Data loading complete. Total files processed: {total_files_processed}. Total new messages inserted: {total_messages_inserted}.")
 
@@ -143,4 +282,8 @@ def load_json_to_postgres():
             logger.info("Database connection closed.")
 
 if __name__ == '__main__':
-    load_json_to_postgres()
\ No newline at end of file
+    listener, log_queue = setup_logging()
+    try:
+        load_json_to_postgres(log_queue)
+    finally:
+        listener.stop()
\ No newline at end of file
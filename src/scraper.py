@@ -1,7 +1,10 @@
 import os
-import json
+import asyncio
+import orjson
+import pyarrow as pa
+import pyarrow.parquet as pq
 from datetime import datetime, timedelta
-from telethon.sync import TelegramClient
+from telethon import TelegramClient
 from telethon.tl.functions.messages import GetHistoryRequest
 from telethon.tl.types import MessageMediaPhoto
 from dotenv import load_dotenv
@@ -36,27 +39,45 @@ CHANNELS = [
 BASE_DATA_LAKE_PATH = 'data/raw/telegram_messages'
 IMAGE_DOWNLOAD_DIR = os.path.join(BASE_DATA_LAKE_PATH, 'images')
 
-# --- JSON Encoder ---
-class DateTimeEncoder(json.JSONEncoder):
-    def default(self, obj):
-        if isinstance(obj, datetime):
-            return obj.isoformat()
-        return super().default(obj)
+# --- Output Settings ---
+OUTPUT_FORMAT = os.getenv('SCRAPER_OUTPUT_FORMAT', 'parquet') # 'parquet' (zstd) or 'json'
+
+# Scalar columns pulled out of each message; the full message is kept as JSON in message_data
+MESSAGE_SCHEMA = pa.schema([
+    ('id', pa.int64()),
+    ('channel_username', pa.string()),
+    ('date', pa.timestamp('us', tz='UTC')),
+    ('message', pa.string()),
+    ('views', pa.int64()),
+    ('image_download_path', pa.string()),
+    ('message_data', pa.string()),
+])
+
+# --- Download Settings ---
+MAX_PARALLEL_DOWNLOADS = 10 # Telegram tolerates about 10 concurrent downloads per client
 
 # --- Sanitize Message for JSON ---
-def sanitize_dict(obj, path='root'):
-    if isinstance(obj, dict):
-        clean = {}
-        for k, v in obj.items():
-            if isinstance(v, bytes):
-                logger.debug(f"Removed bytes at {path}.{k}")
-                continue
-            clean[k] = sanitize_dict(v, path=f"{path}.{k}")
-        return clean
-    elif isinstance(obj, list):
-        return [sanitize_dict(v, path=f"{path}[]") for v in obj]
+def sanitize_inplace(obj):
+    """Deletes bytes values from nested dicts in place, walking the tree iteratively."""
+    debug = logger.isEnabledFor(logging.DEBUG)
+    stack = [obj]
+    while stack:
+        o = stack.pop()
+        if isinstance(o, dict):
+            for k in [k for k, v in o.items() if isinstance(v, bytes)]:
+                if debug:
+                    logger.debug(f"Removed bytes at key {k}")
+                del o[k]
+            stack.extend(v for v in o.values() if isinstance(v, (dict, list)))
+        elif isinstance(o, list):
+            stack.extend(v for v in o if isinstance(v, (dict, list)))
     return obj
 
+def sanitize_messages(messages):
+    """Converts a page of Telethon messages to sanitized dicts; runs in a worker thread."""
+    # to_dict() returns a fresh dict, safe to mutate
+    return [sanitize_inplace(message.to_dict()) for message in messages]
+
 # --- Get Telegram Client ---
 async def get_telegram_client():
     if not API_ID or not API_HASH:
@@ -66,14 +87,26 @@ async def get_telegram_client():
     logger.info("Connected to Telegram")
     return client
 
+# --- Download One Image ---
+async def _download(semaphore, client, msg_dict, message, image_path):
+    async with semaphore:
+        try:
+            downloaded_path = await client.download_media(message, file=image_path)
+            if downloaded_path:
+                msg_dict['image_download_path'] = downloaded_path
+        except Exception as e:
+            logger.warning(f"Image download error for msg {message.id}: {e}")
+
 # --- Scrape Messages from Channel ---
-async def scrape_channel(client, channel_username, limit=500, days_back=30):
+async def scrape_channel(client, channel_username, semaphore, limit=500, days_back=30):
     logger.info(f"Scraping @{channel_username}")
     collected = []
     offset_id = 0
     start_date = datetime.now() - timedelta(days=days_back)
     stop_scraping = False
     os.makedirs(IMAGE_DOWNLOAD_DIR, exist_ok=True)
+    # One directory read up front instead of a stat per photo message
+    existing_images = set(os.listdir(IMAGE_DOWNLOAD_DIR))
 
     entity = await client.get_entity(channel_username)
     pbar = None
@@ -97,13 +130,18 @@ async def scrape_channel(client, channel_username, limit=500, days_back=30):
         if pbar is None:
             pbar = tqdm(total=len(messages), unit="msg", desc=f"@{channel_username}")
 
+        page = []
         for message in messages:
             if message.date.replace(tzinfo=None) < start_date:
                 stop_scraping = True
                 break
+            page.append(message)
+
+        # Convert the whole page in one thread hop so the event loop keeps serving downloads
+        msg_dicts = await asyncio.to_thread(sanitize_messages, page)
 
-            raw_dict = message.to_dict()
-            msg_dict = sanitize_dict(raw_dict)
+        to_download = []
+        for message, msg_dict in zip(page, msg_dicts):
             msg_dict['channel_username'] = channel_username
 
             if message.media and isinstance(message.media, MessageMediaPhoto):
@@ -111,10 +149,9 @@ async def scrape_channel(client, channel_username, limit=500, days_back=30):
                     image_filename = f"{channel_username}_{message.id}_{message.media.photo.id}.jpg"
                     image_path = os.path.join(IMAGE_DOWNLOAD_DIR, image_filename)
 
-                    if not os.path.exists(image_path):
-                        downloaded_path = await client.download_media(message, file=image_path)
-                        if downloaded_path:
-                            msg_dict['image_download_path'] = downloaded_path
+                    if image_filename not in existing_images:
+                        existing_images.add(image_filename)
+                        to_download.append((msg_dict, message, image_path))
                     else:
                         msg_dict['image_download_path'] = image_path
 
@@ -124,6 +161,13 @@ async def scrape_channel(client, channel_username, limit=500, days_back=30):
             collected.append(msg_dict)
             pbar.update(1)
 
+        # Download this page's images concurrently; each task fills in its msg_dict
+        if to_download:
+            await asyncio.gather(*[
+                _download(semaphore, client, msg_dict, message, image_path)
+                for msg_dict, message, image_path in to_download
+            ])
+
         offset_id = messages[-1].id
         if stop_scraping or len(messages) < limit:
             break
@@ -134,7 +178,28 @@ async def scrape_channel(client, channel_username, limit=500, days_back=30):
     logger.info(f"Scraped {len(collected)} messages from @{channel_username}")
     return collected
 
-# --- Save to Channel Folder (One JSON per Channel) ---
+# --- Save to Channel Folder (One File per Channel) ---
+def to_message_table(data):
+    """
+    Builds the Arrow table written to Parquet. Telethon dicts nest media and
+    entities of varying shapes that do not fit one Arrow schema, so only the
+    commonly queried fields become typed columns; message_data holds the full
+    message as JSON, exactly as the raw loader stores it.
+    """
+    rows = [
+        {
+            'id': msg.get('id'),
+            'channel_username': msg.get('channel_username'),
+            'date': msg.get('date'),
+            'message': msg.get('message'),
+            'views': msg.get('views'),
+            'image_download_path': msg.get('image_download_path'),
+            'message_data': orjson.dumps(msg, option=orjson.OPT_NAIVE_UTC).decode(),
+        }
+        for msg in data
+    ]
+    return pa.Table.from_pylist(rows, schema=MESSAGE_SCHEMA)
+
 def save_channel_data(data, channel_username):
     if not data:
         logger.warning(f"No data to save for @{channel_username}")
@@ -144,14 +209,21 @@ def save_channel_data(data, channel_username):
     output_dir = os.path.join(BASE_DATA_LAKE_PATH, today_str, channel_username)
     os.makedirs(output_dir, exist_ok=True)
 
-    json_path = os.path.join(output_dir, f"{channel_username}.json")
+    output_path = os.path.join(output_dir, f"{channel_username}.{OUTPUT_FORMAT}")
 
     try:
-        with open(json_path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=4, ensure_ascii=False, cls=DateTimeEncoder)
-        logger.info(f"Saved {len(data)} messages to {json_path}")
+        if OUTPUT_FORMAT == 'parquet':
+            pq.write_table(to_message_table(data), output_path, compression='zstd')
+        else:
+            # orjson serializes datetimes natively and writes UTF-8 bytes; indent only when debugging
+            option = orjson.OPT_NAIVE_UTC
+            if logger.isEnabledFor(logging.DEBUG):
+                option |= orjson.OPT_INDENT_2
+            with open(output_path, 'wb') as f:
+                f.write(orjson.dumps(data, option=option))
+        logger.info(f"Saved {len(data)} messages to {output_path}")
     except Exception as e:
-        logger.error(f"Error saving JSON for @{channel_username}: {e}")
+        logger.error(f"Error saving {OUTPUT_FORMAT} for @{channel_username}: {e}")
 
 # --- Main ---
 async def main():
@@ -159,8 +231,17 @@ async def main():
     try:
         client = await get_telegram_client()
 
-        for channel in tqdm(CHANNELS, desc="Scraping Channels"):
-            messages = await scrape_channel(client, channel, limit=500, days_back=30)
+        # One semaphore shared by all channels bounds the client's total parallel downloads
+        semaphore = asyncio.Semaphore(MAX_PARALLEL_DOWNLOADS)
+        results = await asyncio.gather(
+            *[scrape_channel(client, channel, semaphore, limit=500, days_back=30) for channel in CHANNELS],
+            return_exceptions=True # A failing channel should not discard the others
+        )
+
+        for channel, messages in zip(CHANNELS, results):
+            if isinstance(messages, Exception):
+                logger.error(f"Error scraping @{channel}: {messages}")
+                continue
             save_channel_data(messages, channel)
 
     except Exception as e:
@@ -172,5 +253,4 @@ async def main():
 
 # --- Run ---
 if __name__ == '__main__':
-    import asyncio
     asyncio.run(main())
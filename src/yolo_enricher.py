@@ -1,9 +1,20 @@
 import os
-import json
-import psycopg2
+import random
+import hashlib
+import yaml
+import orjson
+import asyncio
+import asyncpg
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 import logging
+import cv2
+import numpy as np
+import torch
+from torch.utils.data import Dataset, DataLoader
 from ultralytics import YOLO
+from ultralytics.data.augment import LetterBox
+from ultralytics.utils import ops
 from tqdm import tqdm
 from datetime import datetime
 
@@ -25,34 +36,70 @@ DB_NAME = os.getenv('DB_NAME')
 DB_USER = os.getenv('DB_USER')
 DB_PASSWORD = os.getenv('DB_PASSWORD')
 DB_HOST = os.getenv('DB_HOST')
-DB_PORT = os.getenv('DB_PORT', 5432)
+DB_PORT = int(os.getenv('DB_PORT', 5432))
 
 IMAGE_DOWNLOAD_DIR = 'data/raw/telegram_messages/images'
 RAW_YOLO_TABLE_NAME = 'raw_yolo_detections'
+RAW_PROCESSED_TABLE_NAME = 'raw_yolo_processed_images' # One row per processed image, with or without detections
 RAW_SCHEMA_NAME = 'raw'
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif')
+YOLO_BATCH_SIZE = int(os.getenv('YOLO_BATCH_SIZE', 16)) # Images per forward pass; tune 8-32 to available memory
+DETECTION_FLUSH_ROWS = 1000 # Accumulate at least this many detection rows per COPY/commit
+YOLO_WEIGHTS = os.getenv('YOLO_WEIGHTS', 'yolov8n.pt') # Nano version, smallest and fastest
+YOLO_IMAGE_SIZE = 640
+YOLO_LOADER_WORKERS = int(os.getenv('YOLO_LOADER_WORKERS', 4)) # Processes decoding/letterboxing images ahead of the GPU
+YOLO_USE_TENSORRT = os.getenv('YOLO_USE_TENSORRT', '1') == '1' # Build/use a TensorRT engine on CUDA
+YOLO_PRECISION = os.getenv('YOLO_PRECISION', 'fp16') # TensorRT engine precision: 'fp16' or 'int8'
+# INT8 calibration adds a little noise to the scores, so its default threshold sits above YOLO's 0.25
+YOLO_CONFIDENCE = float(os.getenv('YOLO_CONFIDENCE', 0.35 if YOLO_PRECISION == 'int8' else 0.25))
+CALIBRATION_DIR = 'data/calibration'
+CALIBRATION_IMAGES = 500 # Sample images from IMAGE_DOWNLOAD_DIR used to calibrate the INT8 engine
+YOLO_TORCH_COMPILE = os.getenv('YOLO_TORCH_COMPILE', '0') == '1' # torch.compile the PyTorch model on CUDA (no TensorRT)
 
-# --- 3. Database Connection Function ---
-def get_db_connection():
-    """Establishes and returns a PostgreSQL database connection."""
+# --- 3. Database Pool Function ---
+async def _init_connection(conn):
+    """
+    Runs once for every new pooled connection.
+    Encodes jsonb values with orjson in asyncpg's binary format (a version
+    byte followed by the JSON text), so bounding boxes are passed as Python
+    lists and never go through json.dumps.
+    """
+    await conn.set_type_codec(
+        'jsonb',
+        encoder=lambda value: b'\x01' + orjson.dumps(value),
+        decoder=lambda data: orjson.loads(data[1:]),
+        schema='pg_catalog',
+        format='binary'
+    )
+
+async def create_db_pool():
+    """Creates and returns the asyncpg connection pool used for YOLO enrichment."""
     try:
-        conn = psycopg2.connect(
-            dbname=DB_NAME,
+        pool = await asyncpg.create_pool(
+            database=DB_NAME,
             user=DB_USER,
             password=DB_PASSWORD,
             host=DB_HOST,
-            port=DB_PORT
+            port=DB_PORT,
+            min_size=2,
+            max_size=8,
+            init=_init_connection
         )
-        logger.info("Successfully connected to PostgreSQL database for YOLO enrichment.")
-        return conn
-    except psycopg2.Error as e:
+        logger.info("Successfully created PostgreSQL connection pool for YOLO enrichment.")
+        return pool
+    except (asyncpg.PostgresError, OSError) as e:
         logger.critical(f"Error connecting to PostgreSQL database for YOLO enrichment: {e}")
         raise
 
-# --- 4. Create Raw YOLO Detections Table Function ---
-def create_raw_yolo_table(cursor):
-    """Creates the raw_yolo_detections table if it doesn't exist."""
-    cursor.execute(f"CREATE SCHEMA IF NOT EXISTS {RAW_SCHEMA_NAME};")
-    cursor.execute(f"""
+# --- 4. Create Raw YOLO Tables Function ---
+async def create_raw_yolo_table(conn):
+    """
+    Creates the raw_yolo_detections table, and the raw_yolo_processed_images
+    table recording every processed image (including those without
+    detections), if they don't exist.
+    """
+    await conn.execute(f"CREATE SCHEMA IF NOT EXISTS {RAW_SCHEMA_NAME};")
+    await conn.execute(f"""
         CREATE TABLE IF NOT EXISTS {RAW_SCHEMA_NAME}.{RAW_YOLO_TABLE_NAME} (
             id SERIAL PRIMARY KEY,
             message_id BIGINT NOT NULL,
@@ -65,39 +112,338 @@ def create_raw_yolo_table(cursor):
             UNIQUE (message_id, image_filename, detected_object_class, confidence)
         );
     """)
-    logger.info(f"Ensured table {RAW_SCHEMA_NAME}.{RAW_YOLO_TABLE_NAME} exists.")
+    # Content hash of the source image; an image has many detections, so the index is not unique
+    await conn.execute(f"ALTER TABLE {RAW_SCHEMA_NAME}.{RAW_YOLO_TABLE_NAME} ADD COLUMN IF NOT EXISTS image_sha256 CHAR(64);")
+    await conn.execute(f"CREATE INDEX IF NOT EXISTS {RAW_YOLO_TABLE_NAME}_image_sha256_idx ON {RAW_SCHEMA_NAME}.{RAW_YOLO_TABLE_NAME} (image_sha256);")
+    await conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {RAW_SCHEMA_NAME}.{RAW_PROCESSED_TABLE_NAME} (
+            image_filename VARCHAR(512) PRIMARY KEY,
+            message_id BIGINT NOT NULL,
+            image_sha256 CHAR(64) NOT NULL,
+            processed_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+        );
+    """)
+    await conn.execute(f"CREATE INDEX IF NOT EXISTS {RAW_PROCESSED_TABLE_NAME}_image_sha256_idx ON {RAW_SCHEMA_NAME}.{RAW_PROCESSED_TABLE_NAME} (image_sha256);")
+    logger.info(f"Ensured tables {RAW_SCHEMA_NAME}.{RAW_YOLO_TABLE_NAME} and {RAW_SCHEMA_NAME}.{RAW_PROCESSED_TABLE_NAME} exist.")
+
+# --- 5. Bulk Insert Functions ---
+DETECTION_COLUMNS = ['message_id', 'image_filename', 'detected_object_class', 'confidence', 'bounding_box', 'image_sha256']
+
+def detection_rows(message_id, image_filename, image_sha256, detections):
+    """Expands (class_name, confidence, bbox) detections of one image into raw_yolo_detections rows."""
+    return [
+        (message_id, image_filename, class_name, confidence, bbox, image_sha256)
+        for class_name, confidence, bbox in detections
+    ]
+
+async def copy_detections(conn, rows):
+    """
+    Bulk-loads detection rows with binary COPY into a temporary staging table,
+    then moves them into raw_yolo_detections while skipping rows that already
+    exist (COPY itself cannot do ON CONFLICT). Runs inside the caller's
+    transaction. Returns the number of new rows inserted.
+    """
+    columns = ', '.join(DETECTION_COLUMNS)
+    # Temp tables are per connection and not WAL-logged; ON COMMIT DELETE ROWS empties it per flush
+    await conn.execute(f"""
+        CREATE TEMP TABLE IF NOT EXISTS {RAW_YOLO_TABLE_NAME}_stage (
+            message_id BIGINT,
+            image_filename VARCHAR(512),
+            detected_object_class VARCHAR(255),
+            confidence REAL,
+            bounding_box JSONB,
+            image_sha256 CHAR(64)
+        ) ON COMMIT DELETE ROWS;
+    """)
+    await conn.copy_records_to_table(
+        f"{RAW_YOLO_TABLE_NAME}_stage", records=rows, columns=DETECTION_COLUMNS
+    )
+    status = await conn.execute(f"""
+        INSERT INTO {RAW_SCHEMA_NAME}.{RAW_YOLO_TABLE_NAME} ({columns})
+        SELECT {columns} FROM {RAW_YOLO_TABLE_NAME}_stage
+        ON CONFLICT (message_id, image_filename, detected_object_class, confidence) DO NOTHING;
+    """)
+    return int(status.split()[-1]) # Command tag is 'INSERT 0 <count>'
 
-# --- 5. Main YOLO Enrichment Function ---
-def run_yolo_enrichment():
+async def copy_stored_detections(conn, images):
+    """
+    Gives each (message_id, filename, sha256) image the detections already
+    stored for another image with the same content, instead of running YOLO
+    on it again. Runs inside the caller's transaction. Returns the number of
+    new rows inserted.
+    """
+    columns = ', '.join(DETECTION_COLUMNS)
+    # All stored copies of one content carry the same detections, so read them from any one filename
+    status = await conn.execute(f"""
+        INSERT INTO {RAW_SCHEMA_NAME}.{RAW_YOLO_TABLE_NAME} ({columns})
+        SELECT img.message_id, img.image_filename, src.detected_object_class, src.confidence, src.bounding_box, src.image_sha256
+        FROM unnest($1::bigint[], $2::varchar[], $3::char(64)[]) AS img(message_id, image_filename, image_sha256)
+        JOIN {RAW_SCHEMA_NAME}.{RAW_YOLO_TABLE_NAME} src
+            ON src.image_sha256 = img.image_sha256
+            AND src.image_filename = (
+                SELECT one.image_filename FROM {RAW_SCHEMA_NAME}.{RAW_YOLO_TABLE_NAME} one
+                WHERE one.image_sha256 = img.image_sha256
+                LIMIT 1
+            )
+        ON CONFLICT (message_id, image_filename, detected_object_class, confidence) DO NOTHING;
+    """, *map(list, zip(*images)))
+    return int(status.split()[-1])
+
+async def mark_processed(conn, images):
+    """Records (message_id, filename, sha256) images as processed, whether or not they had detections."""
+    await conn.execute(f"""
+        INSERT INTO {RAW_SCHEMA_NAME}.{RAW_PROCESSED_TABLE_NAME} (message_id, image_filename, image_sha256)
+        SELECT * FROM unnest($1::bigint[], $2::varchar[], $3::char(64)[])
+        ON CONFLICT (image_filename) DO NOTHING;
+    """, *map(list, zip(*images)))
+
+async def save_detections(pool, rows, copies, processed_images):
+    """
+    Writes one flush in a single transaction on a pooled connection: new
+    detection rows (COPY), detections copied for images whose content was
+    already stored, and the processed-image markers.
+    Returns the number of new detection rows inserted, or 0 if the write was
+    rolled back; the flush's images then have no marker and are retried on
+    the next run.
+    """
+    try:
+        async with pool.acquire() as conn:
+            async with conn.transaction():
+                inserted_count = await copy_detections(conn, rows) if rows else 0
+                if copies:
+                    inserted_count += await copy_stored_detections(conn, copies)
+                await mark_processed(conn, processed_images)
+        logger.info(f"Inserted {inserted_count} new detections for {len(processed_images)} images.")
+        return inserted_count
+    except (asyncpg.PostgresError, asyncpg.InterfaceError, OSError) as e:
+        logger.error(f"Error saving detections for {len(processed_images)} images: {e}. They will be retried on the next run.")
+        return 0
+
+# --- 6. Model Loading Functions ---
+def write_calibration_data(class_names):
+    """
+    Writes an Ultralytics dataset YAML listing a random sample of downloaded
+    Telegram images, used by TensorRT to calibrate INT8 activation ranges.
+    Returns the path of the YAML file.
+    """
+    with os.scandir(IMAGE_DOWNLOAD_DIR) as it:
+        image_paths = sorted(os.path.abspath(e.path) for e in it if e.is_file() and e.name.lower().endswith(IMAGE_EXTENSIONS))
+    if not image_paths:
+        raise FileNotFoundError(f"No images in {IMAGE_DOWNLOAD_DIR} to calibrate the INT8 engine with")
+    sample = random.Random(0).sample(image_paths, min(CALIBRATION_IMAGES, len(image_paths)))
+
+    os.makedirs(CALIBRATION_DIR, exist_ok=True)
+    list_path = os.path.abspath(os.path.join(CALIBRATION_DIR, 'calibration.txt'))
+    with open(list_path, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(sample) + '\n')
+    yaml_path = os.path.join(CALIBRATION_DIR, 'calibration.yaml')
+    with open(yaml_path, 'w', encoding='utf-8') as f:
+        yaml.safe_dump({'train': list_path, 'val': list_path, 'names': class_names}, f)
+    logger.info(f"Wrote INT8 calibration set of {len(sample)} images to {yaml_path}.")
+    return yaml_path
+
+def reference_batch():
+    """
+    Returns a full float batch of letterboxed downloaded images on the GPU,
+    used to warm up the compiled model and compare it against eager output.
+    Falls back to random pixels when no images are downloaded yet.
+    """
+    with os.scandir(IMAGE_DOWNLOAD_DIR) as it:
+        image_paths = sorted(e.path for e in it if e.is_file() and e.name.lower().endswith(IMAGE_EXTENSIONS))[:YOLO_BATCH_SIZE]
+    dataset = ImageDataset([(0, os.path.basename(path), path) for path in image_paths], set())
+    _, images, _, _, _ = collate_images([dataset[i] for i in range(len(dataset))])
+    if images is None:
+        images = torch.randint(0, 256, (YOLO_BATCH_SIZE, 3, YOLO_IMAGE_SIZE, YOLO_IMAGE_SIZE), dtype=torch.uint8)
+    # Repeat images to fill the batch so the traced shape matches the real batches
+    images = images[torch.arange(YOLO_BATCH_SIZE) % len(images)]
+    return images.to('cuda').float().div_(255)
+
+def same_detections(expected, actual):
+    """Checks two lists of YOLO results hold the same classes, and boxes and confidences within tolerance."""
+    if len(expected) != len(actual):
+        return False
+    for e, a in zip(expected, actual):
+        if not torch.equal(e.boxes.cls, a.boxes.cls):
+            return False
+        # One pixel on box corners; fused kernels reorder float sums
+        if not torch.allclose(e.boxes.xyxy, a.boxes.xyxy, atol=1.0) or not torch.allclose(e.boxes.conf, a.boxes.conf, atol=1e-2):
+            return False
+    return True
+
+def load_yolo_model():
+    """
+    Loads the YOLO model, preferring a TensorRT engine (FP16, or INT8 with
+    YOLO_PRECISION=int8) when CUDA is available.
+    The engine is exported once next to the weights and reused on later runs;
+    it is specific to the GPU it was built on, so delete it when deploying to
+    different hardware. Falls back to the PyTorch weights otherwise.
+    Must run on the thread that later runs inference: torch.compile's CUDA
+    graphs are captured during the warm-up here.
+    """
+    int8 = YOLO_PRECISION == 'int8'
+    engine_path = os.path.splitext(YOLO_WEIGHTS)[0] + ('_int8' if int8 else '') + '.engine'
+    if YOLO_USE_TENSORRT and torch.cuda.is_available():
+        try:
+            if not os.path.exists(engine_path):
+                logger.info(f"Exporting {YOLO_WEIGHTS} to a TensorRT {YOLO_PRECISION.upper()} engine. This runs once per GPU...")
+                source = YOLO(YOLO_WEIGHTS)
+                export_args = {'data': write_calibration_data(source.names)} if int8 else {}
+                # dynamic=True lets the engine accept any batch size up to YOLO_BATCH_SIZE.
+                # Ultralytics treats half and int8 as exclusive (int8 forces half off), so layers
+                # without an INT8 kernel run in FP32 in the INT8 engine
+                exported_path = source.export(
+                    format='engine', half=not int8, int8=int8, dynamic=True, batch=YOLO_BATCH_SIZE,
+                    imgsz=YOLO_IMAGE_SIZE, **export_args
+                )
+                os.replace(exported_path, engine_path)
+            logger.info(f"Loading TensorRT engine {engine_path}.")
+            return YOLO(engine_path, task='detect')
+        except Exception as e:
+            logger.warning(f"TensorRT engine unavailable ({e}). Falling back to PyTorch weights.")
+
+    logger.info(f"Loading {YOLO_WEIGHTS} model. This may download weights if not cached...")
+    model = YOLO(YOLO_WEIGHTS)
+    if YOLO_TORCH_COMPILE and torch.cuda.is_available():
+        try:
+            batch = reference_batch()
+            # The eager run also builds the predictor, whose AutoBackend holds the fused module it calls
+            expected = model(batch, conf=YOLO_CONFIDENCE, verbose=False)
+            backend = model.predictor.model
+            # Compile the module the predictor calls; compiling model.model before the predictor exists
+            # is undone by AutoBackend's fuse(), which returns the eager module.
+            # reduce-overhead replays captured CUDA graphs, cutting per-kernel launch overhead
+            backend.model = torch.compile(backend.model, mode='reduce-overhead', fullgraph=False)
+            logger.info("Compiling the YOLO model with torch.compile. This traces and captures CUDA graphs once...")
+            model(batch, conf=YOLO_CONFIDENCE, verbose=False)
+            # Compare a replayed run, not the capture run, against the eager output
+            if not same_detections(expected, model(batch, conf=YOLO_CONFIDENCE, verbose=False)):
+                raise RuntimeError("compiled detections differ from eager detections")
+            if not isinstance(model.predictor.model.model, torch._dynamo.eval_frame.OptimizedModule):
+                raise RuntimeError("the predictor is not running the compiled module")
+            logger.info("torch.compile succeeded; compiled detections match the eager model.")
+        except Exception as e:
+            logger.warning(f"torch.compile failed ({e}). Using the eager PyTorch model.")
+            model = YOLO(YOLO_WEIGHTS)
+    return model
+
+# --- 7. Image Dataset ---
+class ImageDataset(Dataset):
+    """
+    Decodes and letterboxes images in DataLoader worker processes so JPEG
+    decoding and resizing overlap with inference instead of running on the
+    main thread before every forward pass.
+    """
+    def __init__(self, items, stored_hashes):
+        self.items = items # (message_id, filename, path) triples
+        self.stored_hashes = stored_hashes # SHA-256 of images already processed by earlier runs
+        self.letterbox = LetterBox(new_shape=(YOLO_IMAGE_SIZE, YOLO_IMAGE_SIZE), auto=False)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __getitem__(self, index):
+        """
+        Returns (message_id, filename, sha256, tensor, orig_shape). tensor is
+        None for content already stored (its detections are copied, not
+        inferred); sha256 is None too for files that could not be read.
+        """
+        message_id, image_filename, image_path = self.items[index]
+        # Any error here would abort the whole DataLoader iteration, so a bad file only skips itself
+        try:
+            # Read the file once: hash the bytes (OpenSSL uses the CPU's SHA extensions) and decode them
+            with open(image_path, 'rb') as f:
+                data = f.read()
+            image_sha256 = hashlib.sha256(data).hexdigest()
+            if image_sha256 in self.stored_hashes:
+                logger.debug(f"Image {image_filename} has the same content as an already processed image. Reusing its detections.")
+                return message_id, image_filename, image_sha256, None, None
+            img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+            if img is None:
+                raise ValueError("not a decodable image")
+            orig_shape = img.shape[:2]
+            img = self.letterbox(image=img)
+            # BGR HWC -> RGB CHW; kept as uint8 so the host-to-device copy stays small
+            tensor = torch.from_numpy(img[..., ::-1].transpose(2, 0, 1).copy())
+        except Exception as e:
+            logger.warning(f"Could not read image {image_filename}: {e}. Skipping.")
+            return message_id, image_filename, None, None, None
+        return message_id, image_filename, image_sha256, tensor, orig_shape
+
+def collate_images(samples):
+    """
+    Stacks decoded samples into one batch.
+    Returns (metas, images, orig_shapes, stored, skipped): stored lists the
+    (message_id, filename, sha256) of already-stored content, skipped counts
+    unreadable files.
+    """
+    decoded = [sample for sample in samples if sample[3] is not None]
+    stored = [(message_id, image_filename, image_sha256) for message_id, image_filename, image_sha256, tensor, _ in samples
+              if tensor is None and image_sha256 is not None]
+    skipped = len(samples) - len(decoded) - len(stored)
+    if not decoded:
+        return [], None, [], stored, skipped
+    metas = [(message_id, image_filename, image_sha256) for message_id, image_filename, image_sha256, _, _ in decoded]
+    images = torch.stack([tensor for _, _, _, tensor, _ in decoded])
+    orig_shapes = [orig_shape for _, _, _, _, orig_shape in decoded]
+    return metas, images, orig_shapes, stored, skipped
+
+def infer_batch(model, images, device):
+    """Runs YOLO on one uint8 batch; called only on the inference thread."""
+    # Normalize on the device; YOLO expects float BCHW tensors in [0, 1]
+    batch_tensor = images.to(device, non_blocking=True).float().div_(255)
+    return model(batch_tensor, conf=YOLO_CONFIDENCE, verbose=False)
+
+# --- 8. Main YOLO Enrichment Function ---
+async def run_yolo_enrichment():
     """
     Loads a YOLO model, processes images, and saves detection results to PostgreSQL.
+    Inference runs on a dedicated worker thread so the COPY of one flush overlaps with
+    inference on the following batches.
     """
-    conn = None
+    pool = None
+    inference_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='yolo-inference')
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
+        pool = await create_db_pool()
 
-        create_raw_yolo_table(cur)
+        async with pool.acquire() as conn:
+            await create_raw_yolo_table(conn)
 
-        # Load a pre-trained YOLOv8n model
-        logger.info("Loading YOLOv8n model. This may download weights if not cached...")
-        model = YOLO('yolov8n.pt') # Uses the nano version, smallest and fastest
+            # Load every already-processed filename and content hash once instead of querying per image.
+            # Detections stored before the marker table existed count as processed too.
+            rows = await conn.fetch(f"""
+                SELECT image_filename, image_sha256 FROM {RAW_SCHEMA_NAME}.{RAW_PROCESSED_TABLE_NAME}
+                UNION
+                SELECT image_filename, image_sha256 FROM {RAW_SCHEMA_NAME}.{RAW_YOLO_TABLE_NAME};
+            """)
+        processed = {row['image_filename'] for row in rows}
+        stored_hashes = {row['image_sha256'] for row in rows if row['image_sha256']}
+        logger.info(f"{len(processed)} images already processed.")
+
+        # Load, warm up and run the model on one dedicated thread: CUDA graphs captured by
+        # torch.compile are replayed on the thread that captured them
+        loop = asyncio.get_running_loop()
+        model = await loop.run_in_executor(inference_executor, load_yolo_model)
+        # model.names is a {class_id: name} dict behind a property; index a plain tuple per box instead
+        class_names = tuple(model.names[i] for i in range(len(model.names)))
 
         total_images_processed = 0
+        total_images_inferred = 0
         total_detections_inserted = 0
 
-        # Get a list of all image files
-        image_files = [f for f in os.listdir(IMAGE_DOWNLOAD_DIR) if f.lower().endswith(('.png', '.jpg', '.jpeg', '.gif'))]
+        # Get all image files; scandir entries already carry the name, full path and file type
+        with os.scandir(IMAGE_DOWNLOAD_DIR) as it:
+            image_entries = [e for e in it if e.is_file() and e.name.lower().endswith(IMAGE_EXTENSIONS)]
 
-        if not image_files:
+        if not image_entries:
             logger.warning("No images found in the download directory to process.")
             return
 
-        logger.info(f"Found {len(image_files)} images to process for YOLO detection.")
-
-        for image_filename in tqdm(image_files, desc="Processing Images with YOLO"):
-            image_path = os.path.join(IMAGE_DOWNLOAD_DIR, image_filename)
+        logger.info(f"Found {len(image_entries)} images to process for YOLO detection.")
 
+        # Select the images still to process, keeping (message_id, filename, path) triples
+        pending_images = []
+        for entry in image_entries:
+            image_filename = entry.name
             # Extract message_id from filename (assuming format: channel_username_messageid_photoid.jpg)
             try:
                 parts = image_filename.split('_')
@@ -107,70 +453,123 @@ def run_yolo_enrichment():
                 logger.warning(f"Could not extract message_id from filename {image_filename}: {e}. Skipping.")
                 continue
 
-            # Check if this image/message_id has already been processed (simple idempotency)
-            # This check is basic; a more robust check would involve hashing the image or checking specific detection entries
-            cur.execute(
-                f"SELECT COUNT(*) FROM {RAW_SCHEMA_NAME}.{RAW_YOLO_TABLE_NAME} WHERE message_id = %s AND image_filename = %s;",
-                (message_id, image_filename)
-            )
-            if cur.fetchone()[0] > 0:
-                logger.info(f"Image {image_filename} (message_id: {message_id}) already processed. Skipping.")
+            # Simple idempotency: the filename embeds the message_id, so a filename match is enough
+            if image_filename in processed:
+                logger.debug(f"Image {image_filename} (message_id: {message_id}) already processed. Skipping.")
                 continue
 
-            total_images_processed += 1
+            pending_images.append((message_id, image_filename, entry.path))
 
-            try:
-                # Run YOLO inference
-                results = model(image_path) # Predict on the image
-
-                detections_for_image = []
-                for r in results: # Iterate over detection results for each image
-                    for box in r.boxes: # Iterate over detected bounding boxes
-                        class_id = int(box.cls[0])
-                        confidence = float(box.conf[0])
-                        class_name = model.names[class_id] # Get class name from model
-
-                        # Bounding box coordinates (x1, y1, x2, y2)
-                        bbox = box.xyxy[0].tolist()
-
-                        detections_for_image.append((
-                            message_id,
-                            image_filename,
-                            class_name,
-                            confidence,
-                            json.dumps(bbox) # Store bounding box as JSON string
-                        ))
-
-                if detections_for_image:
-                    insert_query = f"""
-                        INSERT INTO {RAW_SCHEMA_NAME}.{RAW_YOLO_TABLE_NAME}
-                        (message_id, image_filename, detected_object_class, confidence, bounding_box)
-                        VALUES (%s, %s, %s, %s, %s)
-                        ON CONFLICT (message_id, image_filename, detected_object_class, confidence) DO NOTHING;
-                    """
-                    cur.executemany(insert_query, detections_for_image)
-                    inserted_count = cur.rowcount
-                    total_detections_inserted += inserted_count
-                    logger.info(f"Processed {image_filename}. Inserted {inserted_count} new detections.")
-                else:
-                    logger.info(f"No objects detected in {image_filename}.")
-
-                conn.commit() # Commit after each image or batch
-
-            except Exception as e:
-                logger.error(f"Error processing image {image_filename} with YOLO: {e}")
-                conn.rollback() # Rollback current image's transaction on error
-
-        logger.info(f"YOLO enrichment complete. Total images processed: {total_images_processed}. Total new detections inserted: {total_detections_inserted}.")
+        # Rows waiting to be written; flushed once DETECTION_FLUSH_ROWS accumulate
+        pending_detections = []
+        pending_copies = [] # Images whose detections are copied from stored content
+        pending_processed = [] # (message_id, filename, sha256) of every image in the flush
+        flush_task = None # At most one flush in flight
+        # Detections by content hash for images inferred in this run, reused for reposts
+        run_detections = {}
+
+        use_cuda = torch.cuda.is_available()
+        device = 'cuda' if use_cuda else 'cpu'
+        loader = DataLoader(
+            ImageDataset(pending_images, stored_hashes),
+            batch_size=YOLO_BATCH_SIZE,
+            num_workers=YOLO_LOADER_WORKERS,
+            pin_memory=use_cuda,
+            prefetch_factor=2 if YOLO_LOADER_WORKERS > 0 else None,
+            collate_fn=collate_images
+        )
+
+        try:
+            with tqdm(total=len(pending_images), desc="Processing Images with YOLO") as pbar:
+                for metas, images, orig_shapes, stored, skipped in loader:
+                    batch_count = len(metas) + len(stored) + skipped
+                    # Content already stored by an earlier run: copy its detections instead of inferring again
+                    pending_copies.extend(stored)
+                    pending_processed.extend(stored)
+                    total_images_processed += len(stored)
+
+                    # Reposts of an image already inferred in this run (or earlier in this batch) reuse its results
+                    keep, repeats, batch_hashes = [], [], set()
+                    for i, meta in enumerate(metas):
+                        if meta[2] in run_detections or meta[2] in batch_hashes:
+                            repeats.append(meta)
+                        else:
+                            batch_hashes.add(meta[2])
+                            keep.append(i)
+                    if repeats:
+                        metas = [metas[i] for i in keep]
+                        orig_shapes = [orig_shapes[i] for i in keep]
+                        images = images[keep] if keep else None
+
+                    results = []
+                    if images is not None:
+                        try:
+                            # Run YOLO inference on the whole batch in one call, on the inference thread
+                            results = await loop.run_in_executor(inference_executor, infer_batch, model, images, device)
+                        except Exception as e:
+                            # No marker is stored for these images, so the next run retries them
+                            logger.error(f"Error running YOLO on batch starting with {metas[0][1]}: {e}")
+
+                    # Results come back in the same order as metas
+                    for (message_id, image_filename, image_sha256), orig_shape, r in zip(metas, orig_shapes, results):
+                        total_images_processed += 1
+                        total_images_inferred += 1
+                        # Boxes are in letterboxed coordinates; map them back to the original image.
+                        # Each tensor is converted to Python once per image rather than once per box.
+                        xyxy = ops.scale_boxes(images.shape[2:], r.boxes.xyxy.clone(), orig_shape).cpu().tolist()
+                        confs = r.boxes.conf.cpu().tolist()
+                        class_ids = r.boxes.cls.cpu().to(torch.int32).tolist()
+                        # (class name, confidence, bbox (x1, y1, x2, y2)); bbox is encoded to jsonb by the pool's codec
+                        detections = [
+                            (class_names[class_id], confidence, bbox)
+                            for bbox, confidence, class_id in zip(xyxy, confs, class_ids)
+                        ]
+                        run_detections[image_sha256] = detections
+
+                        if detections:
+                            logger.info(f"Processed {image_filename}. Found {len(detections)} detections.")
+                            pending_detections.extend(detection_rows(message_id, image_filename, image_sha256, detections))
+                        else:
+                            logger.info(f"No objects detected in {image_filename}.")
+                        pending_processed.append((message_id, image_filename, image_sha256))
+
+                    for message_id, image_filename, image_sha256 in repeats:
+                        # Missing only if inference failed for the first copy; the next run retries it
+                        if image_sha256 in run_detections:
+                            total_images_processed += 1
+                            detections = run_detections[image_sha256]
+                            pending_detections.extend(detection_rows(message_id, image_filename, image_sha256, detections))
+                            pending_processed.append((message_id, image_filename, image_sha256))
+
+                    if len(pending_detections) >= DETECTION_FLUSH_ROWS or len(pending_processed) >= DETECTION_FLUSH_ROWS:
+                        if flush_task:
+                            # Cleared before awaiting so the finally never re-awaits a task that raised
+                            done_task, flush_task = flush_task, None
+                            total_detections_inserted += await done_task
+                        # Write in the background while the next batches run through YOLO
+                        flush_task = asyncio.create_task(
+                            save_detections(pool, pending_detections, pending_copies, pending_processed)
+                        )
+                        pending_detections, pending_copies, pending_processed = [], [], []
+
+                    pbar.update(batch_count)
+        finally:
+            # Save what was already inferred even if the loop fails part-way
+            if flush_task:
+                done_task, flush_task = flush_task, None
+                total_detections_inserted += await done_task
+            if pending_processed:
+                total_detections_inserted += await save_detections(pool, pending_detections, pending_copies, pending_processed)
+
+        logger.info(f"YOLO enrichment complete. Total images processed: {total_images_processed} ({total_images_inferred} inferred). Total new detections inserted: {total_detections_inserted}.")
 
     except Exception as e:
         logger.critical(f"Fatal error during YOLO enrichment: {e}")
-        if conn:
-            conn.rollback()
     finally:
-        if conn:
-            conn.close()
-            logger.info("Database connection closed for YOLO enrichment.")
+        inference_executor.shutdown()
+        if pool:
+            await pool.close()
+            logger.info("Database connection pool closed for YOLO enrichment.")
 
 if __name__ == '__main__':
-    run_yolo_enrichment()
\ No newline at end of file
+    asyncio.run(run_yolo_enrichment())
\ No newline at end of file